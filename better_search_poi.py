@@ -1,183 +1,240 @@
-import gpxpy
 import osmnx as ox
 import geopandas as gpd
-from shapely.geometry import LineString, Point
+from shapely.geometry import LineString
 import pandas as pd
-from typing import Dict, List
-import time
+import numpy as np
+from shapely import STRtree
+import shapely
+import shapely.ops
+from pyproj import Transformer
+from typing import Dict, List, Tuple
 import logging
-from gpx_functions import load_gpx_route, create_route_buffer
-import requests
+import logging.handlers
+import hashlib
+import json
+try:
+    import orjson  # Optional, much faster serialization for large routes
+except ImportError:
+    orjson = None
+import os
+from gpx_functions import load_gpx_route, create_route_buffer, estimate_utm_crs, get_elevations
 import folium
 from folium import plugins
 
 # Set up logging
+log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+file_handler = logging.FileHandler('debug_log.txt', mode='w', encoding='utf-8')
+file_handler.setFormatter(logging.Formatter(log_format))
 logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO,
+    format=log_format,
     handlers=[
-        logging.FileHandler('debug_log.txt', mode='w', encoding='utf-8'),
+        logging.handlers.MemoryHandler(capacity=1024, target=file_handler),  # Batch disk writes
         logging.StreamHandler()
     ]
 )
 logger = logging.getLogger(__name__)
 
+# Cache OSM responses on disk between runs
+CACHE_DIR = '.cache'
+ox.settings.use_cache = True
+ox.settings.cache_folder = CACHE_DIR
+
+# Let osmnx check the Overpass status and only wait when no query slot is free
+ox.settings.overpass_rate_limit = True
+
 def get_pois_along_route(buffer_area: gpd.GeoDataFrame) -> Dict[str, gpd.GeoDataFrame]:
-    """Query OSM for POIs within the route buffer"""
+    """Query OSM for POIs and settlements within the route buffer"""
     try:
-        # Define tags for shops and campsites
-        shop_tags = {
-            'shop': [
-                'supermarket', 'convenience', 'grocery',
-                'general', 'food', 'bakery', 'butcher',
-                'greengrocer', 'marketplace', 'mall',
-                'department_store'
-            ]
-        }
-        
-        campsite_tags = {
-            'tourism': ['camp_site', 'caravan_site']
-        }
-
-        # Add delay to respect rate limits
-        time.sleep(1)
-        
-        # Get shops
-        logger.info("Fetching shops...")
-        shops = ox.features_from_polygon(
+        # Define tags for shops, campsites and settlements
+        shop_types = [
+            'supermarket', 'convenience', 'grocery',
+            'general', 'food', 'bakery', 'butcher',
+            'greengrocer', 'marketplace', 'mall',
+            'department_store'
+        ]
+        campsite_types = ['camp_site', 'caravan_site']
+        settlement_types = ['city', 'town', 'village']
+        
+        # Get everything in a single Overpass request
+        logger.info("Fetching shops, campsites and settlements...")
+        features = fetch_features(
             buffer_area.geometry.iloc[0],
-            tags=shop_tags
-        )
-        
-        time.sleep(1)
-        
-        # Get campsites
-        logger.info("Fetching campsites...")
-        campsites = ox.features_from_polygon(
-            buffer_area.geometry.iloc[0],
-            tags=campsite_tags
+            tags={
+                'shop': shop_types,
+                'tourism': campsite_types,
+                'place': settlement_types
+            }
         )
         
         return {
-            'shops': shops,
-            'campsites': campsites
+            'shops': filter_by_tag(features, 'shop', shop_types),
+            'campsites': filter_by_tag(features, 'tourism', campsite_types),
+            'settlements': filter_by_tag(features, 'place', settlement_types)
         }
         
     except Exception as e:
         logger.error(f"Error getting POIs: {e}")
-        return {'shops': gpd.GeoDataFrame(), 'campsites': gpd.GeoDataFrame()}
+        return {'shops': gpd.GeoDataFrame(), 'campsites': gpd.GeoDataFrame(), 'settlements': gpd.GeoDataFrame()}
+
+def fetch_features(polygon, tags: Dict) -> gpd.GeoDataFrame:
+    """Query OSM for features within a polygon, reusing a cached result if available"""
+    key = hashlib.sha1(polygon.wkb + repr(tags).encode()).hexdigest()
+    cache_file = os.path.join(CACHE_DIR, f"{key}.parquet")
+    
+    if os.path.exists(cache_file):
+        logger.info(f"Loading cached features from {cache_file}")
+        return gpd.read_parquet(cache_file)
+    
+    features = ox.features_from_polygon(polygon, tags=tags)
+    
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        features.to_parquet(cache_file)
+    except Exception as e:
+        logger.warning(f"Error caching features: {e}")
+    
+    return features
+
+def filter_by_tag(features: gpd.GeoDataFrame, tag: str, values: List[str]) -> gpd.GeoDataFrame:
+    """Select the features whose tag has one of the given values"""
+    if tag not in features:
+        return features.iloc[0:0]
+    return features[features[tag].isin(values)]
 
-def process_pois(pois: Dict[str, gpd.GeoDataFrame], route: LineString, buffer_area: gpd.GeoDataFrame) -> List[Dict]:
+def process_pois(pois: Dict[str, gpd.GeoDataFrame], route_index: Dict, to_utm,
+                 settlements_utm: gpd.GeoDataFrame, buffer_distance: float) -> List[Dict]:
     """Process POIs into a standardized format"""
     processed = []
     
-    # Process shops
-    for idx, row in pois['shops'].iterrows():
-        try:
-            poi = process_single_poi(row, 'shop', route, buffer_area)
-            if poi:
-                processed.append(poi)
-        except Exception as e:
-            logger.warning(f"Error processing shop: {e}")
+    if pois['shops'].empty and pois['campsites'].empty:
+        return processed
+    
+    # Pull the columns we need from shops and campsites as flat arrays
+    geoms, names, poi_types, specific_types = [], [], [], []
+    for key, poi_type, tag in (('shops', 'shop', 'shop'), ('campsites', 'campsite', 'tourism')):
+        gdf = pois[key]
+        if gdf.empty:
             continue
+        geoms.extend(gdf.geometry.values)
+        names.extend(gdf['name'].to_numpy() if 'name' in gdf else ['Unnamed'] * len(gdf))
+        poi_types.extend([poi_type] * len(gdf))
+        specific_types.extend(gdf[tag].to_numpy())
+    geoms = np.asarray(geoms, dtype=object)
+    
+    # Use centroids for anything that isn't already a point
+    is_point = shapely.get_type_id(geoms) == 0
+    points = geoms.copy()
+    points[~is_point] = shapely.centroid(geoms[~is_point])
+    
+    lons, lats = shapely.get_x(points), shapely.get_y(points)
+    
+    # Convert all POIs to the route's UTM zone with a single PROJ call
+    xs, ys = to_utm(lons, lats)
+    points_utm = shapely.points(xs, ys)
+    
+    # Create Google Maps links - ensure they're proper URLs
+    all_coords = list(zip(lats.tolist(), lons.tolist()))  # lat, lon
+    maps_links = [f"https://www.google.com/maps?q={lat},{lon}" for lat, lon in all_coords]
     
-    # Process campsites
-    for idx, row in pois['campsites'].iterrows():
-        try:
-            poi = process_single_poi(row, 'campsite', route, buffer_area)
-            if poi:
-                processed.append(poi)
-        except Exception as e:
-            logger.warning(f"Error processing campsite: {e}")
+    # Measure distances and find nearest settlements for all POIs in one batch
+    distances = calculate_distances_along_route(points_utm, route_index, buffer_distance)
+    nearest = get_nearest_settlements(points_utm, settlements_utm)
+    
+    for name, poi_type, specific_type, coords, distance_km, near, maps_link in zip(
+            names, poi_types, specific_types, all_coords, distances, nearest, maps_links):
+        # Skip POIs outside the corridor around the route
+        if distance_km is None:
             continue
+        poi = process_single_poi(name, poi_type, specific_type, coords, distance_km, near, maps_link)
+        if poi:
+            processed.append(poi)
+    
+    # Fetch elevations for all POIs in batched requests
+    elevations = get_elevations([poi['coords'] for poi in processed])
+    for poi, elevation in zip(processed, elevations):
+        poi['elevation'] = elevation
     
     # Sort by distance along route
     processed.sort(key=lambda x: x['distance_km'])
     
     return processed
 
-def process_single_poi(row: pd.Series, poi_type: str, route: LineString, buffer_area: gpd.GeoDataFrame) -> Dict:
+def process_single_poi(name: str, poi_type: str, specific_type: str, coords: Tuple[float, float],
+                       distance_km: float, nearest: Dict, maps_link: str) -> Dict:
     """Process a single POI into standardized format"""
     try:
-        name = row.get('name', 'Unnamed')
-        
-        # Get coordinates
-        if isinstance(row.geometry, Point):
-            point = row.geometry
-        else:
-            point = row.geometry.centroid
-            
-        coords = (point.y, point.x)  # lat, lon
-            
-        # Calculate distance along route
-        distance_km = calculate_distance_along_route(point, route)
-        
-        # Get elevation
-        elevation = get_elevation(coords[0], coords[1])
-        
-        # Get nearest settlement
-        nearest = get_nearest_settlement(point, buffer_area)
-            
-        # Get specific type
-        specific_type = (
-            row.get('shop') if poi_type == 'shop'
-            else row.get('tourism')
-        )
-        
-        # Create Google Maps link - ensure it's a proper URL
-        maps_link = f"https://www.google.com/maps?q={coords[0]},{coords[1]}"
-        
         return {
             'name': name,
             'type': poi_type,
             'specific_type': specific_type,
-            'coords': coords,
-            'elevation': elevation,
+            'coords': coords,  # lat, lon
+            'elevation': None,  # Filled in by process_pois
             'distance_km': distance_km,
             'nearest_settlement': nearest['name'],
             'settlement_type': nearest['type'],
             'settlement_distance': nearest['distance'],
-            'maps_link': maps_link,
-            'all_tags': dict(row)
+            'maps_link': maps_link
         }
     except Exception as e:
-        logger.warning(f"Error processing POI {name}: {e}")
+        logger.warning(f"Error processing {poi_type} {name}: {e}")
         return None
 
-def calculate_distance_along_route(point: Point, route: LineString) -> float:
-    """Calculate the distance along the route to the nearest point to the POI"""
+def index_route(route_utm: LineString, segment_length: float = 100) -> Dict:
+    """Split the route into short segments and index them for nearest-segment lookups"""
+    coords = shapely.get_coordinates(shapely.segmentize(route_utm, segment_length))
+    segments = shapely.linestrings(np.stack([coords[:-1], coords[1:]], axis=1))
+    
+    # Measure segments straight from the coordinates rather than through GEOS
+    vectors = np.diff(coords, axis=0)
+    lengths = np.hypot(*vectors.T)
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    
+    return {
+        'tree': STRtree(segments),
+        'starts': coords[:-1],
+        'vectors': vectors,
+        'lengths': lengths,
+        'offsets': cumulative[:-1],  # Distance to the start of each segment
+        'length': cumulative[-1]
+    }
+
+def calculate_distances_along_route(points_utm: np.ndarray, route_index: Dict, max_distance: float) -> List[float]:
+    """Calculate the distance along the route to the nearest point to each POI
+    
+    POIs further than max_distance from the route get None.
+    """
     try:
-        # Convert to UTM for accurate distance measurement
-        route_gdf = gpd.GeoDataFrame(geometry=[route], crs="EPSG:4326")
-        point_gdf = gpd.GeoDataFrame(geometry=[point], crs="EPSG:4326")
-        
-        # Convert both to same UTM zone
-        utm_crs = route_gdf.estimate_utm_crs()
-        route_utm = route_gdf.to_crs(utm_crs).geometry.iloc[0]
-        point_utm = point_gdf.to_crs(utm_crs).geometry.iloc[0]
-        
-        # Find the nearest point on the route
-        nearest_point_dist = route_utm.project(point_utm)
+        distances_km = [None] * len(points_utm)
+        if len(points_utm) == 0:
+            return distances_km
         
-        # Get the total length for verification
-        total_length = route_utm.length
+        # Find the nearest route segment to each POI within the corridor
+        point_idx, segment_idx = route_index['tree'].query_nearest(
+            points_utm, max_distance=max_distance, all_matches=False
+        )
         
-        # Ensure we don't return a distance beyond the route length
-        distance = min(nearest_point_dist, total_length)
+        # Distance along route is the start of the segment plus the position within it,
+        # found by projecting each POI onto its two-point segment
+        relative = shapely.get_coordinates(points_utm[point_idx]) - route_index['starts'][segment_idx]
+        vectors = route_index['vectors'][segment_idx]
+        lengths = route_index['lengths'][segment_idx]
+        dots = np.einsum('ij,ij->i', relative, vectors)
+        t = np.clip(np.divide(dots, lengths ** 2, out=np.zeros_like(dots), where=lengths > 0), 0, 1)
+        distances = route_index['offsets'][segment_idx] + t * lengths
         
         # Convert to km and round to 2 decimal places
-        distance_km = round(distance / 1000, 2)
+        for i, distance in zip(point_idx, np.round(distances / 1000, 2)):
+            distances_km[i] = float(distance)
         
-        # Log some debug info
-        logger.debug(f"Point: {point.coords[0]}")
-        logger.debug(f"Distance along route: {distance_km}km")
-        logger.debug(f"Total route length: {total_length/1000:.2f}km")
+        logger.debug("Distances along route: %s", distances_km)
+        logger.debug("Total route length: %.2fkm", route_index['length'] / 1000)
         
-        return distance_km
+        return distances_km
         
     except Exception as e:
-        logger.warning(f"Error calculating distance: {e}")
-        return 0.0
+        logger.warning(f"Error calculating distances: {e}")
+        return [0.0] * len(points_utm)
 
 def find_pois_along_route(gpx_file: str, buffer_distance: float = 500) -> tuple[List[Dict], LineString]:
     """Main function to find POIs along a GPX route"""
@@ -185,23 +242,32 @@ def find_pois_along_route(gpx_file: str, buffer_distance: float = 500) -> tuple[
         # Load and process the route
         route = load_gpx_route(gpx_file)
         
+        # Convert the route to UTM for accurate distance measurement
+        utm_crs = estimate_utm_crs(route)
+        to_utm = Transformer.from_crs("EPSG:4326", utm_crs, always_xy=True).transform
+        route_utm = shapely.ops.transform(to_utm, route)
+        
+        # Index the route for distance lookups
+        route_index = index_route(route_utm)
+        
         # Log route length
-        route_gdf = gpd.GeoDataFrame(geometry=[route], crs="EPSG:4326")
-        utm_crs = route_gdf.estimate_utm_crs()
-        route_utm = route_gdf.to_crs(utm_crs).geometry.iloc[0]
-        total_length_km = route_utm.length / 1000
+        total_length_km = route_index['length'] / 1000
         logger.info(f"Route length: {total_length_km:.2f}km")
         
         # Create a buffer for the entire route
         logger.info("Creating buffer for route...")
-        buffer_area = create_route_buffer(route, buffer_distance)
+        buffer_area = create_route_buffer(route_utm, utm_crs, buffer_distance)
         
-        # Get all POIs in one go
+        # Get all POIs and settlements in one go
         logger.info("Fetching POIs...")
         pois = get_pois_along_route(buffer_area)
         
+        # Convert settlements to UTM once for all distance calculations
+        settlements = pois['settlements']
+        settlements_utm = settlements.to_crs(utm_crs) if not settlements.empty else settlements
+        
         # Process the POIs
-        processed_pois = process_pois(pois, route, buffer_area)
+        processed_pois = process_pois(pois, route_index, to_utm, settlements_utm, buffer_distance)
         
         if not processed_pois:
             logger.warning("No POIs found along route")
@@ -217,34 +283,33 @@ def find_pois_along_route(gpx_file: str, buffer_distance: float = 500) -> tuple[
 def save_results(pois: List[Dict], route: LineString, csv_file: str, html_file: str):
     """Save results to CSV and HTML files"""
     try:
-        # Prepare data for DataFrame
-        df_data = []
-        for poi in pois:
-            lat, lon = poi['coords']
+        # Prepare data for DataFrame one column at a time
+        df = pd.DataFrame({
+            'Distance': np.fromiter((poi['distance_km'] for poi in pois), dtype=float, count=len(pois)),
+            'Name': [poi['name'] for poi in pois],
+            'Type': [poi['specific_type'] for poi in pois],
+            'Category': [poi['type'] for poi in pois],
             # Format elevation without brackets
-            elevation_str = f"{poi['elevation']}m" if poi['elevation'] is not None else "Unknown"
-            nearest_settlement = f"{poi['nearest_settlement']} ({poi['settlement_type']}, {poi['settlement_distance']}km)"
-            
-            df_data.append({
-                'Distance': poi['distance_km'],
-                'Name': poi['name'],
-                'Type': poi['specific_type'],
-                'Category': poi['type'],
-                'Elevation': elevation_str,
-                'Nearest Settlement': nearest_settlement,
-                'Coordinates': f"{lat}, {lon}",
-                'Google Maps': poi['maps_link'],
-                'coords': poi['coords']
-            })
+            'Elevation': [
+                f"{poi['elevation']}m" if poi['elevation'] is not None else "Unknown"
+                for poi in pois
+            ],
+            'Nearest Settlement': [
+                f"{poi['nearest_settlement']} ({poi['settlement_type']}, {poi['settlement_distance']}km)"
+                for poi in pois
+            ],
+            'Coordinates': [f"{poi['coords'][0]}, {poi['coords'][1]}" for poi in pois],
+            'Google Maps': [poi['maps_link'] for poi in pois],
+            'coords': [poi['coords'] for poi in pois]
+        })
         
         # Save to CSV with string formatting
-        df = pd.DataFrame(df_data)
         csv_columns = ['Distance', 'Name', 'Type', 'Category', 'Elevation', 'Nearest Settlement', 'Coordinates', 'Google Maps']
         df[csv_columns].to_csv(csv_file, index=False, quoting=1)  # Use subset of columns for CSV
         logger.info(f"Results saved to {csv_file}")
         
         # Create HTML with route
-        html_content = create_html_report(df_data, route)
+        html_content = create_html_report(df.to_dict('records'), route)
         with open(html_file, 'w', encoding='utf-8') as f:
             f.write(html_content)
         logger.info(f"HTML report saved to {html_file}")
@@ -332,106 +397,92 @@ def create_html_report(data: List[Dict], route: LineString) -> str:
 </body>
 </html>"""
 
+    popup_template = (
+        "<b>{Name}</b><br>"
+        "Type: {Type}<br>"
+        "Distance: {Distance}km<br>"
+        "Elevation: {Elevation}<br>"
+        "<a href='https://www.google.com/maps?q={lat},{lon}' target='_blank'>View in Google Maps</a>"
+    )
+
+    row_template = """
+        <tr class="poi-row {row_class}" onclick="zoomToPOI({lat}, {lon})">
+            <td class="distance">{Distance} km</td>
+            <td>{Name}</td>
+            <td>{Type}</td>
+            <td class="elevation">{Elevation}</td>
+            <td>{Nearest Settlement}</td>
+        </tr>"""
+
+    icon_base = 'https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-'
+
     # Prepare route coordinates
     route_coords = [[y, x] for x, y in route.coords]
     
     # Prepare markers data
-    markers_data = []
-    for item in data:
-        lat, lon = item['coords']
-        icon_url = ('https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/'
-                   f"marker-icon-{'green' if item['Category'] == 'campsite' else 'red'}.png")
-        
-        # Create popup without escaping the URL
-        popup_html = f"""
-            <b>{item['Name']}</b><br>
-            Type: {item['Type']}<br>
-            Distance: {item['Distance']}km<br>
-            Elevation: {item['Elevation']}<br>
-            <a href='https://www.google.com/maps?q={lat},{lon}' target='_blank'>View in Google Maps</a>
-        """
-        
-        markers_data.append({
-            'lat': lat,
-            'lon': lon,
-            'icon': icon_url,
-            'popup': popup_html.replace('\n', '')  # Remove newlines but don't escape quotes
-        })
+    markers_data = [
+        {
+            'lat': item['coords'][0],
+            'lon': item['coords'][1],
+            'icon': f"{icon_base}{'green' if item['Category'] == 'campsite' else 'red'}.png",
+            'popup': popup_template.format_map(dict(item, lat=item['coords'][0], lon=item['coords'][1]))
+        }
+        for item in data
+    ]
 
     # Generate rows
-    rows = []
-    for item in data:
-        lat, lon = item['coords']
-        row_class = 'campsite' if item['Category'] == 'campsite' else f"shop-{item['Type']}"
-        
-        row = f"""
-        <tr class="poi-row {row_class}" onclick="zoomToPOI({lat}, {lon})">
-            <td class="distance">{item['Distance']} km</td>
-            <td>{item['Name']}</td>
-            <td>{item['Type']}</td>
-            <td class="elevation">{item['Elevation']}</td>
-            <td>{item['Nearest Settlement']}</td>
-        </tr>"""
-        rows.append(row)
+    rows = ''.join(
+        row_template.format_map(dict(
+            item,
+            lat=item['coords'][0],
+            lon=item['coords'][1],
+            row_class='campsite' if item['Category'] == 'campsite' else f"shop-{item['Type']}"
+        ))
+        for item in data
+    )
 
-    # Replace placeholders in template
+    # Replace placeholders in template, serializing JS data as proper JSON
     html_content = html_template.format(
-        rows=''.join(rows),
-        route_coords=str(route_coords),
-        markers_data=str(markers_data)
+        rows=rows,
+        route_coords=to_json(route_coords),
+        markers_data=to_json(markers_data)
     )
     
     return html_content
 
-def get_elevation(lat: float, lon: float) -> float:
-    """Fetch elevation data using open-meteo API"""
-    try:
-        url = f"https://api.open-meteo.com/v1/elevation?latitude={lat}&longitude={lon}"
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            return data['elevation']
-        return None
-    except Exception as e:
-        logger.warning(f"Error getting elevation: {e}")
-        return None
+def to_json(data) -> str:
+    """Serialize data as JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(data)
 
-def get_nearest_settlement(point: Point, buffer_area: gpd.GeoDataFrame) -> Dict:
-    """Find the nearest settlement (village or larger) to a point"""
+def get_nearest_settlements(points_utm: np.ndarray, settlements_utm: gpd.GeoDataFrame) -> List[Dict]:
+    """Find the nearest settlement (village or larger) to each point"""
+    unknown = {'name': 'Unknown', 'type': 'Unknown', 'distance': 0}
     try:
-        # Query for settlements
-        settlement_tags = {
-            'place': ['city', 'town', 'village']
-        }
-        
-        settlements = ox.features_from_polygon(
-            buffer_area.geometry.iloc[0],
-            tags=settlement_tags
-        )
-        
-        if settlements.empty:
-            return {'name': 'Unknown', 'type': 'Unknown', 'distance': 0}
-        
-        # Convert settlements to same CRS as point for distance calculation
-        point_gdf = gpd.GeoDataFrame(geometry=[point], crs="EPSG:4326")
-        utm_crs = point_gdf.estimate_utm_crs()
-        point_utm = point_gdf.to_crs(utm_crs)
-        settlements_utm = settlements.to_crs(utm_crs)
-        
-        # Calculate distances to all settlements
-        distances = settlements_utm.geometry.distance(point_utm.geometry.iloc[0])
-        nearest_idx = distances.idxmin()
-        nearest = settlements.loc[nearest_idx]
-        
-        return {
-            'name': nearest.get('name', 'Unknown'),
-            'type': nearest.get('place', 'Unknown'),
-            'distance': round(distances[nearest_idx] / 1000, 2)  # Convert to km
-        }
+        if settlements_utm.empty:
+            return [dict(unknown) for _ in range(len(points_utm))]
+        
+        # Index settlements once and look up the nearest one for every point
+        geoms = settlements_utm.geometry.values
+        names = settlements_utm['name'].tolist() if 'name' in settlements_utm else [None] * len(geoms)
+        types = settlements_utm['place'].tolist() if 'place' in settlements_utm else [None] * len(geoms)
+        tree = STRtree(geoms)
+        nearest_idx = tree.nearest(points_utm)
+        distances = shapely.distance(geoms[nearest_idx], points_utm)
+        
+        return [
+            {
+                'name': names[i] if pd.notna(names[i]) else 'Unknown',
+                'type': types[i] if pd.notna(types[i]) else 'Unknown',
+                'distance': round(distance / 1000, 2)  # Convert to km
+            }
+            for i, distance in zip(nearest_idx, distances)
+        ]
         
     except Exception as e:
-        logger.warning(f"Error finding nearest settlement: {e}")
-        return {'name': 'Unknown', 'type': 'Unknown', 'distance': 0}
+        logger.warning(f"Error finding nearest settlements: {e}")
+        return [dict(unknown) for _ in range(len(points_utm))]
 
 def main():
     try:
@@ -1,55 +1,138 @@
-import gpxpy
-import osmnx as ox
+from array import array
+from lxml import etree
 import geopandas as gpd
 from shapely.geometry import LineString, Point
+from shapely.ops import polygonize, substring, unary_union
 import pandas as pd
+import numpy as np
 from typing import List, Dict, Tuple
-import time
+import csv
 from math import ceil
 import logging
+import logging.handlers
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    import orjson  # Optional, much faster parsing of large responses
+except ImportError:
+    orjson = None
+from concurrent.futures import ThreadPoolExecutor
+import shapely
+from pyproj import CRS, Transformer
+from pyproj.aoi import AreaOfInterest
+from pyproj.database import query_utm_crs_info
 
 # Set up logging
+log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+file_handler = logging.FileHandler('debug_log.txt', mode='w', encoding='utf-8')  # Add UTF-8 encoding
+file_handler.setFormatter(logging.Formatter(log_format))
 logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO,
+    format=log_format,
     handlers=[
-        logging.FileHandler('debug_log.txt', mode='w', encoding='utf-8'),  # Add UTF-8 encoding
+        logging.handlers.MemoryHandler(capacity=1024, target=file_handler),  # Batch disk writes
         logging.StreamHandler()  # Keep console output
     ]
 )
 logger = logging.getLogger(__name__)
 
+try:
+    import requests_cache  # Optional, caches HTTP responses on disk between runs
+    session = requests_cache.CachedSession(
+        'routethink_http_cache',
+        expire_after=86400,
+        allowable_methods=('GET', 'POST')  # Overpass queries are POSTs
+    )
+except ImportError:
+    session = requests.Session()
+
+# Reuse connections and back off when rate limited or the server is busy
+session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=[429, 502, 504],
+        allowed_methods=None  # Overpass queries are POSTs
+    )
+))
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+# Douglas-Peucker tolerance for loaded routes, in degrees (about 10 m)
+ROUTE_SIMPLIFY_TOLERANCE = 1e-4
+
+# Elevation APIs accept at most 100 locations per request
+ELEVATION_BATCH_SIZE = 100
+ELEVATION_WORKERS = 8
+
+# Elevations already fetched this run, keyed by rounded (lat, lon)
+elevation_cache: Dict[Tuple[float, float], float] = {}
+
 def load_gpx_route(gpx_file: str) -> LineString:
     """Load GPX file and convert to LineString"""
     try:
-        with open(gpx_file, 'r') as gpx_file:
-            gpx = gpxpy.parse(gpx_file)
+        # Stream track points rather than building the whole GPX document in memory
+        lons = array('d')
+        lats = array('d')
+        for _, elem in etree.iterparse(gpx_file, tag='{*}trkpt'):
+            lons.append(float(elem.get('lon')))
+            lats.append(float(elem.get('lat')))
             
-        points = []
-        for track in gpx.tracks:
-            for segment in track.segments:
-                for point in segment.points:
-                    points.append((point.longitude, point.latitude))
+            # Free parsed elements as we go
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
         
-        if not points:
+        if not lons:
             raise ValueError("No points found in GPX file")
             
-        return LineString(points)
+        # Drop redundant points from dense recordings; far finer than the buffer
+        route = LineString(np.column_stack([lons, lats]))
+        return route.simplify(ROUTE_SIMPLIFY_TOLERANCE, preserve_topology=False)
     except Exception as e:
         logger.error(f"Error loading GPX file: {e}")
         raise
 
-def split_route(route: LineString, chunk_size: float = 50000) -> List[LineString]:
-    """Split route into chunks of specified size in meters with overlap"""
+def estimate_utm_crs(route: LineString) -> CRS:
+    """Estimate the UTM CRS for a route in EPSG:4326 from its bounding box centre"""
+    minx, miny, maxx, maxy = route.bounds
+    x_center = (minx + maxx) / 2
+    y_center = (miny + maxy) / 2
+    utm_crs_list = query_utm_crs_info(
+        datum_name="WGS 84",
+        area_of_interest=AreaOfInterest(
+            west_lon_degree=x_center,
+            south_lat_degree=y_center,
+            east_lon_degree=x_center,
+            north_lat_degree=y_center
+        )
+    )
+    if not utm_crs_list:
+        raise RuntimeError("Unable to determine UTM CRS")
+    return CRS.from_epsg(utm_crs_list[0].code)
+
+def transform_geometry(geometry, transformer: Transformer):
+    """Reproject a geometry (or array of geometries) with a single pyproj call over all coordinates"""
+    return shapely.transform(
+        geometry,
+        lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1]))
+    )
+
+def split_route(route_utm: LineString, utm_crs, chunk_size: float = 50000) -> List[LineString]:
+    """Split a route already projected to utm_crs into chunks of specified size in meters with overlap"""
     try:
-        # Convert to UTM for accurate distance measurement
-        route_gdf = gpd.GeoDataFrame(geometry=[route], crs="EPSG:4326")
-        utm_crs = route_gdf.estimate_utm_crs()
-        route_utm = route_gdf.to_crs(utm_crs)
-        
         # Get total length
-        total_length = route_utm.geometry.iloc[0].length
+        total_length = route_utm.length
+        
+        # Transform function for converting chunks back to lat/lon
+        from_utm = Transformer.from_crs(utm_crs, "EPSG:4326", always_xy=True)
+        
+        # Short routes fit in one chunk, so there is nothing to cut
+        if total_length <= chunk_size:
+            return [transform_geometry(route_utm, from_utm)]
         
         # Calculate number of chunks
         n_chunks = ceil(total_length / chunk_size)
@@ -57,59 +140,28 @@ def split_route(route: LineString, chunk_size: float = 50000) -> List[LineString
         # Add 1km overlap between chunks
         overlap = 1000
         
-        chunks = []
-        for i in range(n_chunks):
-            start = max(0, i * chunk_size - overlap)
-            end = min(total_length, (i + 1) * chunk_size + overlap)
-            
-            chunk = cut_line_at_distance(route_utm.geometry.iloc[0], start, end)
-            # Convert chunk to GeoDataFrame before changing CRS
-            chunk_gdf = gpd.GeoDataFrame(geometry=[chunk], crs=utm_crs)
-            chunks.append(chunk_gdf.to_crs("EPSG:4326").geometry.iloc[0])
-            
-        return chunks
+        # Work out where every chunk starts and ends up front
+        offsets = np.arange(n_chunks) * chunk_size
+        starts = np.maximum(offsets - overlap, 0)
+        ends = np.minimum(offsets + chunk_size + overlap, total_length)
+        chunks = [cut_line_at_distance(route_utm, start, end) for start, end in zip(starts, ends)]
+        
+        # Convert all chunks back to lat/lon in one go
+        return list(transform_geometry(np.array(chunks), from_utm))
     except Exception as e:
         logger.error(f"Error splitting route: {e}")
         raise
 
 def cut_line_at_distance(line: LineString, start_dist: float, end_dist: float) -> LineString:
     """Cut a line at specified distances"""
-    if start_dist < 0:
-        start_dist = 0
-    if end_dist > line.length:
-        end_dist = line.length
-        
-    coords = []
-    current_dist = 0
-    
-    for i in range(len(line.coords) - 1):
-        p1 = Point(line.coords[i])
-        p2 = Point(line.coords[i + 1])
-        segment = LineString([p1, p2])
-        segment_length = segment.length
-        
-        if current_dist + segment_length < start_dist:
-            current_dist += segment_length
-            continue
-            
-        if current_dist > end_dist:
-            break
-            
-        coords.append(line.coords[i])
-        
-        current_dist += segment_length
-    
-    if coords:
-        coords.append(line.coords[-1])
-    return LineString(coords)
+    return substring(line, max(start_dist, 0), min(end_dist, line.length))
 
-def create_route_buffer(route: LineString, buffer_distance: float = 500) -> gpd.GeoDataFrame:
-    """Create a buffer around the route in meters"""
+def create_route_buffer(route_utm: LineString, utm_crs, buffer_distance: float = 500) -> gpd.GeoDataFrame:
+    """Create a buffer in meters around a route already projected to utm_crs"""
     try:
-        route_gdf = gpd.GeoDataFrame(geometry=[route], crs="EPSG:4326")
-        route_utm = route_gdf.to_crs(route_gdf.estimate_utm_crs())
-        buffered = route_utm.buffer(buffer_distance)
-        return buffered.to_crs("EPSG:4326")
+        from_utm = Transformer.from_crs(utm_crs, "EPSG:4326", always_xy=True)
+        buffered = transform_geometry(shapely.buffer(route_utm, buffer_distance), from_utm)
+        return gpd.GeoDataFrame(geometry=[buffered], crs="EPSG:4326")
     except Exception as e:
         logger.error(f"Error creating route buffer: {e}")
         raise
@@ -117,81 +169,148 @@ def create_route_buffer(route: LineString, buffer_distance: float = 500) -> gpd.
 def get_settlements_with_rate_limit(buffer_area: gpd.GeoDataFrame) -> List[Dict]:
     """Query OSM for settlements with rate limiting"""
     try:
-        time.sleep(1)
+        # No fixed delay: the session retries 429 responses after the server's Retry-After
+        polygon = buffer_area.geometry.iloc[0]
+        poly_str = ' '.join(f'{lat} {lon}' for lon, lat in polygon.exterior.coords)
         
-        # First get settlements
-        tags = {
-            'place': ['city', 'town', 'village']
-        }
+        # Get settlements and administrative boundaries in a single request
+        # (admin level 4 is typically county, 6 is typically district).
+        # Country boundaries are too large to download, so each settlement is
+        # followed by the tags of the country area containing it instead
+        overpass_query = f"""
+        [out:json][timeout:60];
+        nwr(poly:"{poly_str}")[place~"^(city|town|village)$"]->.settlements;
+        foreach.settlements(
+          out center tags;
+          (._; node(w););
+          is_in;
+          area._[boundary=administrative][admin_level="2"];
+          out tags;
+        );
+        relation(poly:"{poly_str}")[boundary=administrative][admin_level~"^(4|6)$"];
+        out geom;
+        """
         
-        settlements = ox.features_from_polygon(
-            buffer_area.geometry.iloc[0],
-            tags=tags
-        )
+        response = session.post(OVERPASS_URL, data={"data": overpass_query}, timeout=90)
+        response.raise_for_status()
+        elements = parse_json(response).get('elements', [])
         
-        # Then get administrative boundaries
-        admin_tags = {
-            'boundary': 'administrative',
-            'admin_level': ['4', '6']  # 4 is typically county, 6 is typically district
-        }
+        # Boundaries are the only elements printed with their members; country
+        # areas belong to the settlement printed just before them
+        settlement_elements = []
+        for element in elements:
+            if element['type'] == 'area':
+                if settlement_elements:
+                    settlement_elements[-1].setdefault('country', element.get('tags', {}).get('name'))
+            elif 'members' not in element:
+                settlement_elements.append(element)
         
-        admin_areas = ox.features_from_polygon(
-            buffer_area.geometry.iloc[0],
-            tags=admin_tags
-        )
+        settlements = build_settlements_gdf(settlement_elements)
+        admin_areas = build_admin_areas_gdf([e for e in elements if 'members' in e])
         
         return process_settlements(settlements, admin_areas)
     except Exception as e:
         logger.error(f"Error getting settlements: {e}")
         return []
 
+def build_settlements_gdf(elements: List[Dict]) -> gpd.GeoDataFrame:
+    """Build a GeoDataFrame of settlement points from Overpass elements, with any country in '@country'"""
+    records = []
+    points = []
+    countries = []
+    for element in elements:
+        # Get coordinates - for ways and relations, use center coordinates
+        if element['type'] == 'node':
+            point = Point(element['lon'], element['lat'])
+        elif 'center' in element:
+            point = Point(element['center']['lon'], element['center']['lat'])
+        else:
+            continue
+        records.append(element.get('tags', {}))
+        points.append(point)
+        countries.append(element.get('country', np.nan))
+    
+    settlements = gpd.GeoDataFrame(records, geometry=points, crs="EPSG:4326")
+    settlements['@country'] = pd.Series(countries, index=settlements.index, dtype=object)
+    return settlements
+
+def build_admin_areas_gdf(elements: List[Dict]) -> gpd.GeoDataFrame:
+    """Build a GeoDataFrame of boundary polygons from Overpass relations printed with out geom"""
+    records = []
+    areas = []
+    for element in elements:
+        # Assemble the outer ways into polygons
+        outer = [
+            LineString([(node['lon'], node['lat']) for node in member['geometry']])
+            for member in element.get('members', [])
+            if member['type'] == 'way' and member.get('role') == 'outer' and len(member.get('geometry', [])) > 1
+        ]
+        polygons = list(polygonize(outer))
+        if not polygons:
+            continue
+        records.append(element.get('tags', {}))
+        areas.append(unary_union(polygons))
+    
+    return gpd.GeoDataFrame(records, geometry=areas, crs="EPSG:4326")
+
+def find_admin_names(points: gpd.GeoSeries, admin_areas: gpd.GeoDataFrame, admin_level: str) -> List:
+    """Name of the admin area at the given level containing each point (NaN where none does)"""
+    if admin_areas.empty or 'admin_level' not in admin_areas or 'name' not in admin_areas:
+        return [np.nan] * len(points)
+    
+    areas = admin_areas.loc[admin_areas['admin_level'] == admin_level]
+    tree = shapely.STRtree(areas.geometry.values)
+    point_idx, area_idx = tree.query(points.values, predicate='within')
+    
+    # Overlapping areas give several matches per point; the last one wins
+    names = np.full(len(points), np.nan, dtype=object)
+    names[point_idx] = areas['name'].values[area_idx]
+    return names.tolist()
+
 def process_settlements(settlements: gpd.GeoDataFrame, admin_areas: gpd.GeoDataFrame) -> List[Dict]:
     """Process settlements into desired format with enhanced location info"""
     processed = []
     
-    for idx, row in settlements.iterrows():
+    if settlements.empty:
+        return processed
+    
+    # Settlements are already points; find the admin areas containing them in one go
+    points = settlements.geometry
+    counties = find_admin_names(points, admin_areas, '4')  # County level
+    
+    # Country names come from the Overpass is_in lookup, where available
+    if '@country' in settlements:
+        countries = settlements['@country']
+    else:
+        countries = [np.nan] * len(settlements)
+    
+    # Fallback to existing tags if admin areas didn't work, in order of preference
+    locality_tags = ['addr:county', 'is_in:county', 'is_in', 'addr:state', 'is_in:state', 'addr:district']
+    country_tags = ['addr:country', 'is_in:country']
+    tags = pd.DataFrame(settlements).reindex(columns=locality_tags + country_tags)
+    
+    localities = pd.Series(counties, index=settlements.index, dtype=object)
+    for tag in locality_tags:
+        localities = localities.combine_first(tags[tag])
+    localities = localities.fillna('Unknown')
+    
+    countries = pd.Series(countries, index=settlements.index, dtype=object)
+    for tag in country_tags:
+        countries = countries.combine_first(tags[tag])
+    countries = countries.fillna('United Kingdom')  # Default for UK locations
+    
+    # Build each settlement's tag dict lazily from plain tuples
+    settlement_tags = settlements.drop(columns=[points.name, '@country'], errors='ignore')
+    columns = settlement_tags.columns.tolist()
+    rows = settlement_tags.itertuples(index=False, name=None)
+    for values, point, locality, country in zip(rows, points, localities, countries):
         try:
-            name = row.get('name', 'Unknown')
-            place_type = row.get('place', 'Unknown')
+            rec = dict(zip(columns, values))
+            name = rec.get('name', 'Unknown')
+            place_type = rec.get('place', 'Unknown')
             
             # Get coordinates
-            if isinstance(row.geometry, Point):
-                coords = (row.geometry.x, row.geometry.y)
-                point = row.geometry
-            else:
-                point = row.geometry.centroid
-                coords = (point.x, point.y)
-            
-            # Find which admin areas contain this point
-            locality = 'Unknown'
-            country = 'Unknown'
-            
-            for _, admin_row in admin_areas.iterrows():
-                if admin_row.geometry.contains(point):
-                    admin_level = admin_row.get('admin_level')
-                    if admin_level == '4':  # County level
-                        locality = admin_row.get('name', locality)
-                    elif admin_level == '2':  # Country level
-                        country = admin_row.get('name', country)
-            
-            # Fallback to existing tags if admin areas didn't work
-            if locality == 'Unknown':
-                locality = (
-                    row.get('addr:county') or
-                    row.get('is_in:county') or
-                    row.get('is_in') or
-                    row.get('addr:state') or
-                    row.get('is_in:state') or
-                    row.get('addr:district') or
-                    'Unknown'
-                )
-            
-            if country == 'Unknown':
-                country = (
-                    row.get('addr:country') or
-                    row.get('is_in:country') or
-                    'United Kingdom'  # Default for UK locations
-                )
+            coords = (point.x, point.y)
             
             processed.append({
                 'name': name,
@@ -200,7 +319,7 @@ def process_settlements(settlements: gpd.GeoDataFrame, admin_areas: gpd.GeoDataF
                 'locality': locality,
                 'country': country,
                 'full_name': f"{name}, {locality}, {country}",
-                'all_tags': dict(row)
+                'all_tags': rec
             })
         except Exception as e:
             logger.warning(f"Error processing settlement {name}: {e}")
@@ -216,9 +335,14 @@ def find_settlements_along_route(gpx_file: str,
         # Load and process the route
         route = load_gpx_route(gpx_file)
         
+        # Convert to UTM once for accurate distance measurement
+        utm_crs = estimate_utm_crs(route)
+        to_utm = Transformer.from_crs("EPSG:4326", utm_crs, always_xy=True)
+        route_utm = transform_geometry(route, to_utm)
+        
         # Create a single buffer for the entire route
         logger.info("Creating buffer for entire route...")
-        buffer_area = create_route_buffer(route, buffer_distance)
+        buffer_area = create_route_buffer(route_utm, utm_crs, buffer_distance)
         
         # Get all settlements in one API call
         logger.info("Fetching settlements...")
@@ -235,40 +359,70 @@ def find_settlements_along_route(gpx_file: str,
         logger.error(f"Error in main processing: {e}")
         raise
 
+def parse_json(response: requests.Response):
+    """Decode a JSON response body, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
 def get_elevation(lat: float, lon: float) -> float:
     """Fetch elevation data using alternative sources"""
+    return get_elevations([(lat, lon)])[0]
+
+def get_elevations(coords: List[Tuple[float, float]]) -> List[float]:
+    """Fetch elevation data for many (lat, lon) pairs using concurrent batched requests"""
+    # Round to ~100m, about the resolution of the elevation data, so nearby points share a lookup
+    rounded = [(round(lat, 3), round(lon, 3)) for lat, lon in coords]
+    missing = list(dict.fromkeys(c for c in rounded if c not in elevation_cache))
+    
+    batches = [missing[i:i + ELEVATION_BATCH_SIZE] for i in range(0, len(missing), ELEVATION_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=ELEVATION_WORKERS) as executor:
+        for batch, elevations in zip(batches, executor.map(get_elevation_batch, batches)):
+            for c, elevation in zip(batch, elevations):
+                # Don't remember failures so they are retried next time
+                if elevation is not None:
+                    elevation_cache[c] = elevation
+    
+    return [elevation_cache.get(c) for c in rounded]
+
+def get_elevation_batch(batch: List[Tuple[float, float]]) -> List[float]:
+    """Fetch elevation data for up to ELEVATION_BATCH_SIZE (lat, lon) pairs using alternative sources"""
     try:
+        lats = ','.join(str(lat) for lat, _ in batch)
+        lons = ','.join(str(lon) for _, lon in batch)
+        locations = '|'.join(f"{lat},{lon}" for lat, lon in batch)
+        
         # Try multiple elevation APIs in order
         apis = [
-            f"https://api.open-meteo.com/v1/elevation?latitude={lat}&longitude={lon}",
-            f"https://api.opentopodata.org/v1/srtm90m?locations={lat},{lon}"
+            f"https://api.open-meteo.com/v1/elevation?latitude={lats}&longitude={lons}",
+            f"https://api.opentopodata.org/v1/srtm90m?locations={locations}"
         ]
         
         for url in apis:
             try:
-                response = requests.get(url, timeout=5)  # 5 second timeout
+                response = session.get(url, timeout=5)  # 5 second timeout
                 if response.status_code == 200:
-                    data = response.json()
+                    data = parse_json(response)
                     # Handle different API response formats
                     if 'elevation' in data:  # open-meteo format
                         return data['elevation']
                     elif 'results' in data:  # opentopodata format
-                        return data['results'][0]['elevation']
+                        return [result['elevation'] for result in data['results']]
             except Exception as e:
-                logger.debug(f"API attempt failed: {e}")
+                logger.debug("API attempt failed: %s", e)
                 continue
                 
         logger.warning("All elevation APIs failed")
-        return None
+        return [None] * len(batch)
         
     except Exception as e:
         logger.warning(f"Error getting elevation: {e}")
-        return None
+        return [None] * len(batch)
 
 def main():
     try:
         gpx_file = "gpx_test.gpx"
-        logger.debug(f"Starting processing for GPX file: {gpx_file}")
+        logger.debug("Starting processing for GPX file: %s", gpx_file)
         
         settlements = find_settlements_along_route(
             gpx_file,
@@ -287,42 +441,44 @@ def main():
         type_order = {'city': 0, 'town': 1, 'village': 2}
         settlements.sort(key=lambda x: type_order.get(x['type'], 999))
         
-        # Create a list of dictionaries with just the fields we want
-        output_data = []
-        for s in settlements:
-            # Swap longitude and latitude for Google Maps format
-            lat, lon = s['coords'][1], s['coords'][0]
-            
-            # Get elevation data with delay between requests
-            elevation = get_elevation(lat, lon)
-            time.sleep(1)  # Add delay between elevation requests
-            elevation_str = f"{elevation}m" if elevation is not None else "Unknown"
-            
-            # Create Google Maps link
-            maps_link = f"https://www.google.com/maps?q={lat},{lon}"
-            
-            settlement_data = {
-                'Name': s['name'],
-                'Locality': s['locality'],
-                'Country': s['country'],
-                'Type': s['type'],
-                'Coordinates': f"{lat}, {lon}",
-                'Elevation': elevation_str,
-                'Google Maps': maps_link
-            }
-            output_data.append(settlement_data)
-            
-            # Only log non-null values to reduce debug log noise
-            logger.debug(f"Settlement: {settlement_data}")
-            logger.debug(f"All tags for {s['name']}:")
-            for key, value in s['all_tags'].items():
-                if value is not None and value != 'nan' and key != 'geometry':
-                    logger.debug(f"  {key}: {value}")
+        # Get elevation data for all settlements at once
+        elevations = get_elevations([(s['coords'][1], s['coords'][0]) for s in settlements])
         
-        # Convert to DataFrame and save to CSV
-        df = pd.DataFrame(output_data)
+        # Write just the fields we want straight to CSV
         output_file = 'settlements.csv'
-        df.to_csv(output_file, index=False)
+        fieldnames = ['Name', 'Locality', 'Country', 'Type', 'Coordinates', 'Elevation', 'Google Maps']
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, lineterminator='\n')
+            writer.writeheader()
+            
+            for s, elevation in zip(settlements, elevations):
+                # Swap longitude and latitude for Google Maps format
+                lat, lon = s['coords'][1], s['coords'][0]
+                
+                elevation_str = f"{elevation}m" if elevation is not None else "Unknown"
+                
+                # Create Google Maps link
+                maps_link = f"https://www.google.com/maps?q={lat},{lon}"
+                
+                settlement_data = {
+                    'Name': s['name'],
+                    'Locality': s['locality'],
+                    'Country': s['country'],
+                    'Type': s['type'],
+                    'Coordinates': f"{lat}, {lon}",
+                    'Elevation': elevation_str,
+                    'Google Maps': maps_link
+                }
+                writer.writerow(settlement_data)
+                
+                # Only log non-null values to reduce debug log noise
+                logger.debug("Settlement: %s", settlement_data)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("All tags for %s:", s['name'])
+                    for key, value in s['all_tags'].items():
+                        if value is not None and value != 'nan' and key != 'geometry':
+                            logger.debug("  %s: %s", key, value)
+        
         logger.info(f"Settlements saved to {output_file}")
         
         # Console output for quick review
@@ -1,95 +1,255 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import csv
+import io
+import math
+import numpy as np
+try:
+    import numba  # Optional, compiles the nearest-settlement search
+except ImportError:
+    numba = None
 from typing import Dict, List, Tuple
 
-def check_amenities_near_settlement(lat: float, lon: float, radius: int = 500) -> Dict:
+try:
+    import requests_cache  # Optional, caches HTTP responses on disk between runs
+    session = requests_cache.CachedSession(
+        'routethink_http_cache',
+        expire_after=86400,
+        allowable_methods=('GET', 'POST')  # Overpass queries are POSTs
+    )
+except ImportError:
+    session = requests.Session()
+
+# Reuse connections and back off when rate limited or the server is busy
+session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=[429, 502, 504],
+        allowed_methods=None  # Overpass queries are POSTs
+    )
+))
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+
+SHOP_TYPES = (
+    "supermarket|convenience|grocery|general|food|bakery|butcher"
+    "|greengrocer|marketplace|mall|department_store"
+)
+
+# Number of settlements to check in a single Overpass request
+BATCH_SIZE = 50
+
+# Below this many POI-settlement pairs the NumPy distance matrix is faster than the JIT kernel
+JIT_MIN_PAIRS = 100000
+
+def haversine(lat1, lon1, lat2, lon2):
     """
-    Check for shops and campsites near a given coordinate using Overpass API.
+    Great-circle distance in meters between coordinates in degrees.
+    
+    Works element-wise on NumPy arrays, so it can build a whole distance matrix at once.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371000 * np.arcsin(np.sqrt(a))
+
+if numba is not None:
+    # Fast math without 'ninf'/'nnan', since the search starts from and compares against infinity
+    @numba.njit(parallel=True, cache=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'})
+    def _assign_nearest_jit(poi_lat, poi_lon, s_lat, s_lon, max_m):
+        out = np.empty(poi_lat.size, dtype=np.int64)
+        for i in numba.prange(poi_lat.size):
+            lat1 = math.radians(poi_lat[i])
+            lon1 = math.radians(poi_lon[i])
+            best = np.inf
+            idx = -1
+            for j in range(s_lat.size):
+                lat2 = math.radians(s_lat[j])
+                lon2 = math.radians(s_lon[j])
+                a = (
+                    math.sin((lat2 - lat1) / 2) ** 2
+                    + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+                )
+                d = 2 * 6371000 * math.asin(math.sqrt(a))
+                if d < best:
+                    best = d
+                    idx = j
+            out[i] = idx if best < max_m else -1
+        return out
+
+def assign_nearest(poi_lat: np.ndarray, poi_lon: np.ndarray,
+                   s_lat: np.ndarray, s_lon: np.ndarray, max_m: float = np.inf) -> np.ndarray:
+    """
+    Find the nearest settlement to each POI.
     
     Args:
-        lat: Latitude of the settlement
-        lon: Longitude of the settlement
+        poi_lat, poi_lon: POI coordinates in degrees
+        s_lat, s_lon: Settlement coordinates in degrees
+        max_m: Maximum distance in meters for a match
+    
+    Returns:
+        Index of the nearest settlement for each POI, or -1 if none is within max_m
+    """
+    if numba is not None and poi_lat.size * s_lat.size >= JIT_MIN_PAIRS:
+        return _assign_nearest_jit(poi_lat, poi_lon, s_lat, s_lon, max_m)
+    
+    distances = haversine(poi_lat[:, None], poi_lon[:, None], s_lat[None, :], s_lon[None, :])
+    nearest = distances.argmin(axis=1)
+    nearest[distances[np.arange(len(nearest)), nearest] >= max_m] = -1
+    return nearest
+
+def check_amenities_near_settlements(settlement_coords: List[Tuple[float, float]], radius: int = 500) -> List[Dict]:
+    """
+    Check for shops and campsites near several coordinates using one Overpass API request.
+    
+    Args:
+        settlement_coords: List of (lat, lon) tuples for the settlements
         radius: Search radius in meters (default 500m)
     
     Returns:
-        Dictionary with shop and campsite locations
+        List of dictionaries with shop and campsite locations, one per settlement
     """
-    overpass_url = "https://overpass-api.de/api/interpreter"
+    results = [{"shops": [], "campsites": []} for _ in settlement_coords]
+    if not settlement_coords:
+        return results
     
-    shop_types = (
-        "supermarket|convenience|grocery|general|food|bakery|butcher"
-        "|greengrocer|marketplace|mall|department_store"
+    # Union the searches around every settlement into a single query
+    clauses = ''.join(
+        f"""
+      nwr(around:{radius},{lat},{lon})["shop"~"{SHOP_TYPES}"];
+      nwr(around:{radius},{lat},{lon})["tourism"="camp_site"];"""
+        for lat, lon in settlement_coords
     )
-    
+    # Ask for CSV with just the fields we use instead of full JSON
     overpass_query = f"""
-    [out:json][timeout:25];
-    (
-      // Search for various types of shops
-      way(around:{radius},{lat},{lon})["shop"~"{shop_types}"];
-      node(around:{radius},{lat},{lon})["shop"~"{shop_types}"];
-      
-      // Search for campsites
-      way(around:{radius},{lat},{lon})["tourism"="camp_site"];
-      node(around:{radius},{lat},{lon})["tourism"="camp_site"];
+    [out:csv(::type,::lat,::lon,name,shop,tourism; true; "|")][timeout:60];
+    ({clauses}
     );
-    out center body;
-    >;
-    out skel qt;
+    out center;
     """
     
     try:
-        response = requests.post(overpass_url, data={"data": overpass_query})
+        response = session.post(OVERPASS_URL, data={"data": overpass_query})
         response.raise_for_status()
-        data = response.json()
+        reader = csv.reader(io.StringIO(response.text), delimiter='|', quoting=csv.QUOTE_NONE)
+        next(reader, None)  # Skip header
+        
+        elements = []
+        element_coords = []
+        for row in reader:
+            if len(row) < 6:
+                print(f"Skipping malformed Overpass row: {'|'.join(row)}")
+                continue
+            # Names may contain the '|' delimiter; shop and tourism never do
+            _, lat, lon, *name_parts, shop, tourism = row
+            name = '|'.join(name_parts)
+            # Ways and relations come with center coordinates; skip anything without any
+            if not lat or not lon:
+                continue
+            elements.append({"name": name, "shop": shop, "tourism": tourism})
+            element_coords.append((float(lat), float(lon)))
         
-        elements = data.get("elements", [])
+        if not elements:
+            return results
         
-        shops = []
-        campsites = []
+        # Assign each element to its nearest settlement within the search radius
+        element_coords = np.array(element_coords)
+        settlement_array = np.array(settlement_coords)
+        nearest = assign_nearest(
+            element_coords[:, 0], element_coords[:, 1],
+            settlement_array[:, 0], settlement_array[:, 1],
+            max_m=radius
+        )
         
-        for element in elements:
-            # Get coordinates - for ways, use center coordinates
-            if element["type"] == "way" and "center" in element:
-                coords = (element["center"]["lat"], element["center"]["lon"])
-            elif element["type"] == "node":
-                coords = (element["lat"], element["lon"])
-            else:
+        for element, coords, idx in zip(elements, element_coords.tolist(), nearest):
+            # Way and relation centres can fall outside the search radius
+            if idx < 0:
                 continue
-                
+            
+            coords = tuple(coords)
+            
             # Store name if available
-            name = element.get("tags", {}).get("name", "Unnamed")
+            name = element["name"] or "Unnamed"
             
             # Check if it's a shop or campsite
-            if "shop" in element.get("tags", {}):
-                shop_type = element["tags"]["shop"]
-                shops.append({
+            if element["shop"]:
+                results[idx]["shops"].append({
                     "name": name,
-                    "type": shop_type,
+                    "type": element["shop"],
                     "coords": coords,
                     "maps_link": f"https://www.google.com/maps?q={coords[0]},{coords[1]}"
                 })
             
-            if element.get("tags", {}).get("tourism") == "camp_site":
-                campsites.append({
+            if element["tourism"] == "camp_site":
+                results[idx]["campsites"].append({
                     "name": name,
                     "coords": coords,
                     "maps_link": f"https://www.google.com/maps?q={coords[0]},{coords[1]}"
                 })
         
-        time.sleep(0.5)  # Reduced wait time to 0.5 seconds
-        
-        return {
-            "shops": shops,
-            "campsites": campsites
-        }
+        return results
         
     except Exception as e:
         print(f"Error querying Overpass API: {str(e)}")
-        return {
-            "shops": [],
-            "campsites": []
-        }
+        return results
+
+def check_amenities_near_settlement(lat: float, lon: float, radius: int = 500) -> Dict:
+    """
+    Check for shops and campsites near a given coordinate using Overpass API.
+    
+    Args:
+        lat: Latitude of the settlement
+        lon: Longitude of the settlement
+        radius: Search radius in meters (default 500m)
+    
+    Returns:
+        Dictionary with shop and campsite locations
+    """
+    return check_amenities_near_settlements([(lat, lon)], radius)[0]
+
+def format_result_row(result: Dict) -> str:
+    """
+    Format one settlement's amenities as an HTML table row.
+    
+    Args:
+        result: Dictionary containing settlement and amenity data
+    
+    Returns:
+        HTML for the table row
+    """
+    # Create location link
+    coords = result['Coordinates'].strip('"')
+    location_link = f'<a href="https://www.google.com/maps?q={coords}" target="_blank">{coords}</a>'
+    
+    # Format shops information
+    shops = result['shops']
+    shops_cell = '<span class="not-found">No shops found</span>'
+    if shops:
+        shops_cell = f'<span class="found">{len(shops)} found:</span><br>' + '<br>'.join(
+            f'<a href="{shop["maps_link"]}" target="_blank">{shop["name"]} ({shop["type"]}) at {shop["coords"][0]},{shop["coords"][1]}</a>'
+            for shop in shops
+        )
+    
+    # Format campsites information
+    campsites = result['campsites']
+    campsites_cell = '<span class="not-found">No campsites found</span>'
+    if campsites:
+        campsites_cell = f'<span class="found">{len(campsites)} found:</span><br>' + '<br>'.join(
+            f'<a href="{camp["maps_link"]}" target="_blank">{camp["name"]} at {camp["coords"][0]},{camp["coords"][1]}</a>'
+            for camp in campsites
+        )
+    
+    locality = result.get('Locality', '').strip('"')
+    locality_text = f'<br>{locality}' if locality else ''
+    
+    return f'<tr><td>{result["Name"]}{locality_text}</td><td>{location_link}</td><td>{shops_cell}</td><td>{campsites_cell}</td></tr>'
 
 def create_html_report(results: List[Dict], output_file: str) -> None:
     """
@@ -125,47 +285,44 @@ def create_html_report(results: List[Dict], output_file: str) -> None:
 </body>
 </html>"""
     
-    rows = []
-    for result in results:
-        # Create location link
-        coords = result['Coordinates'].strip('"')
-        location_link = f'<a href="https://www.google.com/maps?q={coords}" target="_blank">{coords}</a>'
-        
-        # Format shops information
-        shops_cell = '<span class="not-found">No shops found</span>'
-        if result['Has Shop']:
-            shops = result['Shop Details'].split('; ')
-            shop_links = result['Shop Links'].split('; ')
-            shops_list = []
-            for shop, link in zip(shops, shop_links):
-                shops_list.append(f'<a href="{link}" target="_blank">{shop}</a>')
-            shops_cell = f'<span class="found">{len(shops)} found:</span><br>' + '<br>'.join(shops_list)
-        
-        # Format campsites information
-        campsites_cell = '<span class="not-found">No campsites found</span>'
-        if result['Has Campsite']:
-            campsites = result['Campsite Details'].split('; ')
-            campsite_links = result['Campsite Links'].split('; ')
-            campsites_list = []
-            for campsite, link in zip(campsites, campsite_links):
-                campsites_list.append(f'<a href="{link}" target="_blank">{campsite}</a>')
-            campsites_cell = f'<span class="found">{len(campsites)} found:</span><br>' + '<br>'.join(campsites_list)
-        
-        locality = result.get('Locality', '').strip('"')
-        locality_text = f'<br>{locality}' if locality else ''
-        
-        row = f'<tr><td>{result["Name"]}{locality_text}</td><td>{location_link}</td><td>{shops_cell}</td><td>{campsites_cell}</td></tr>'
-        rows.append(row)
-    
-    # Create the complete HTML
-    html_content = html_template.format(rows=''.join(rows))
+    header, footer = html_template.split('{rows}')
     
-    # Write the HTML file
+    # Write the HTML file one row at a time
     with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+        f.write(header.format())
+        for result in results:
+            f.write(format_result_row(result))
+        f.write(footer.format())
     
     print(f"HTML report written to {output_file}")
 
+def csv_row(result: Dict) -> Dict:
+    """
+    Flatten one settlement's amenity lists into the CSV columns.
+    
+    Args:
+        result: Dictionary containing settlement data and amenity lists
+    
+    Returns:
+        Dictionary with the amenities joined into '; '-separated strings
+    """
+    shops = result['shops']
+    campsites = result['campsites']
+    row = dict(result)
+    row['Has Shop'] = bool(shops)
+    row['Shop Details'] = '; '.join(
+        f"{shop['name']} ({shop['type']}) at {shop['coords'][0]},{shop['coords'][1]}"
+        for shop in shops
+    )
+    row['Shop Links'] = '; '.join(shop['maps_link'] for shop in shops)
+    row['Has Campsite'] = bool(campsites)
+    row['Campsite Details'] = '; '.join(
+        f"{camp['name']} at {camp['coords'][0]},{camp['coords'][1]}"
+        for camp in campsites
+    )
+    row['Campsite Links'] = '; '.join(camp['maps_link'] for camp in campsites)
+    return row
+
 def check_amenities_for_all_settlements(settlements_file: str, output_csv: str, output_html: str) -> None:
     """
     Process all settlements from a CSV file and check for nearby amenities.
@@ -181,50 +338,40 @@ def check_amenities_for_all_settlements(settlements_file: str, output_csv: str,
             reader = csv.DictReader(f)
             rows = list(reader)
             
+        settlement_coords = [
+            tuple(map(float, row['Coordinates'].strip('"').split(',')))
+            for row in rows
+        ]
+        
+        # Check settlements in batches, one Overpass request per batch
+        all_amenities = []
+        for i in range(0, len(rows), BATCH_SIZE):
+            if i > 0:
+                time.sleep(0.5)
+            batch = settlement_coords[i:i + BATCH_SIZE]
+            print(f"Checking amenities for settlements {i + 1}-{i + len(batch)} of {len(rows)}...")
+            all_amenities.extend(check_amenities_near_settlements(batch))
+        
+        # Keep the amenities as lists of dicts; they are only flattened to
+        # strings when written to the CSV
         results = []
-        for row in rows:
-            name = row['Name']
-            coords_str = row['Coordinates'].strip('"')
-            lat, lon = map(float, coords_str.split(','))
-            
-            print(f"Checking amenities for {name}...")
-            amenities = check_amenities_near_settlement(lat, lon)
-            
+        for row, amenities in zip(rows, all_amenities):
             new_row = dict(row)
-            new_row['Has Shop'] = bool(amenities['shops'])
-            new_row['Shop Details'] = '; '.join(
-                f"{shop['name']} ({shop['type']}) at {shop['coords'][0]},{shop['coords'][1]}"
-                for shop in amenities['shops']
-            ) if amenities['shops'] else ''
-            new_row['Shop Links'] = '; '.join(
-                shop['maps_link'] for shop in amenities['shops']
-            ) if amenities['shops'] else ''
-            
-            new_row['Has Campsite'] = bool(amenities['campsites'])
-            new_row['Campsite Details'] = '; '.join(
-                f"{camp['name']} at {camp['coords'][0]},{camp['coords'][1]}"
-                for camp in amenities['campsites']
-            ) if amenities['campsites'] else ''
-            new_row['Campsite Links'] = '; '.join(
-                camp['maps_link'] for camp in amenities['campsites']
-            ) if amenities['campsites'] else ''
-            
+            new_row['shops'] = amenities['shops']
+            new_row['campsites'] = amenities['campsites']
             results.append(new_row)
         
         # Write CSV file
         with open(output_csv, 'w', newline='') as f:
-            base_fieldnames = [f for f in results[0].keys() if f not in [
-                'Has Shop', 'Shop Details', 'Shop Links',
-                'Has Campsite', 'Campsite Details', 'Campsite Links'
-            ]]
+            base_fieldnames = list(rows[0].keys()) if rows else []
             fieldnames = base_fieldnames + [
                 'Has Shop', 'Shop Details', 'Shop Links',
                 'Has Campsite', 'Campsite Details', 'Campsite Links'
             ]
             
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
             writer.writeheader()
-            writer.writerows(results)
+            writer.writerows(csv_row(result) for result in results)
         
         # Create HTML report
         create_html_report(results, output_html)
@@ -0,0 +1,20 @@
+import geopandas as gpd
+from shapely.geometry import Point
+
+from gpx_functions import process_settlements
+
+
+def test_process_settlements_without_admin_areas():
+    settlements = gpd.GeoDataFrame(
+        {'name': ['Alston', 'Garrigill'], 'place': ['town', 'village']},
+        geometry=[Point(-2.44, 54.81), Point(-2.40, 54.77)],
+        crs="EPSG:4326"
+    )
+    admin_areas = gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+
+    processed = process_settlements(settlements, admin_areas)
+
+    assert len(processed) == 2
+    assert [s['name'] for s in processed] == ['Alston', 'Garrigill']
+    assert processed[0]['coords'] == (-2.44, 54.81)
+    assert processed[0]['locality'] == 'Unknown'